@@ -7,7 +7,9 @@
 """Python infrastructure for the Mathematical Logic through Programming book."""
 
 from functools import wraps
-from typing import Any, Callable, Dict, Iterator, Set, Type, TypeVar, cast
+from itertools import count
+from types import MappingProxyType
+from typing import Any, Callable, Iterator, Mapping, Type, TypeVar
 
 T = TypeVar('T')
 
@@ -20,48 +22,55 @@ def frozen(cls: Type[T]) -> Type[T]:
 
     Returns:
         The given class, modified so that assignment to instance variable is
-        disallowed after construction.
+        disallowed after construction. Each instance records whether it is
+        still being constructed in a ``_frozen`` attribute, which must be
+        listed in the `__slots__` of a class that declares them. Initializing
+        an already constructed instance again, e.g., one that `__new__`
+        returned from a cache, leaves it unchanged.
     """
     original_init = cls.__init__
     original_setattr = cls.__setattr__
     original_delattr = cls.__delattr__
-    mutable_ids: Set[int] = set()
     @wraps(cls.__setattr__)
     def setattr_wrapper(self, name, value):
-        if id(self) in mutable_ids:
+        if not getattr(self, '_frozen', True):
             original_setattr(self, name, value)
         else:
             raise Exception("Cannot assign to field '" + name +
                             "' of immutable class '" + cls.__name__ + "'")
     @wraps(cls.__delattr__)
     def delattr_wrapper(self, name, value):
-        if id(self) in mutable_ids:
+        if not getattr(self, '_frozen', True):
             original_delattr(self, name, value)
         else:
             raise Exception("Cannot delete field '" + name +
                             "' of immutable class '" + cls.__name__ + "'")
     @wraps(cls.__init__)
     def init_wrapper(self, *args, **kwargs):
-        mutable_ids.add(id(self))
+        if getattr(self, '_frozen', False):
+            return
+        object.__setattr__(self, '_frozen', False)
         original_init(self, *args, **kwargs)
-        mutable_ids.remove(id(self))
+        object.__setattr__(self, '_frozen', True)
 
     setattr(cls, '__setattr__', setattr_wrapper)
     setattr(cls, '__delattr__',  delattr_wrapper)
     setattr(cls, '__init__', init_wrapper)
     return cls
 
-class frozendict(Dict[Any, Any]):
-    """An immutable variant of the built-in `dict` class."""
+def frozendict(*args, **kwargs) -> Mapping[Any, Any]:
+    """Creates an immutable mapping, as an alternative to the built-in `dict`
+    class.
 
-    def __init__(self, *args, **kwargs):
-        super().update(dict(*args, **kwargs))
+    Parameters:
+        args: positional arguments, as accepted by `dict`.
+        kwargs: keyword arguments, as accepted by `dict`.
 
-    def update(self, *args, **kwargs):
-        raise Exception('Cannot modify a frozendict')
+    Returns:
+        A read-only view of a new `dict` constructed from the given arguments.
+    """
+    return MappingProxyType(dict(*args, **kwargs))
 
-    __delattr__ = __delitem__ = __setattr__ = __setitem__ = clear = pop = \
-                  popitem = setdefault =  cast(Callable[..., Any], update)
 S = TypeVar('S')
 
 def memoized_parameterless_method(method: Callable[[T], S]) -> Callable[[T], S]:
@@ -98,18 +107,17 @@ class __prefix_with_index_sequence_generator:
 
     def __init__(self, prefix: str) -> None:
         self.__prefix = prefix
-        self.__counter = 0
+        self.__counter = count(1)
 
     def __iter__(self) -> Iterator[str]:
         return self
 
     def __next__(self) -> str:
-        self.__counter = self.__counter + 1
-        return self.__prefix + str(self.__counter)
+        return self.__prefix + str(next(self.__counter))
 
     def _reset_for_test(self) -> None:
         """ Reset this generator. For use by tests only """
-        self.__counter = 0
+        self.__counter = count(1)
 
 #: A generator for fresh variable names. The first call to
 #: `next`\ ``(``\ `fresh_variable_name_generator`\ ``)`` will return ``'z1'``,
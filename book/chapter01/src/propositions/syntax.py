@@ -7,13 +7,25 @@
 """Syntactic handling of propositional formulas."""
 
 from __future__ import annotations
+import re
+import sys
 from functools import lru_cache
-from typing import Mapping, Optional, Set, Tuple
-from itertools import takewhile
+from typing import Any, List, Mapping, Optional, Set, Tuple
+from weakref import WeakValueDictionary
+
+from logic_utils import frozen
+
+#: The characters that may start an atomic proposition.
+_VAR_FIRST = frozenset(chr(c) for c in range(ord('p'), ord('z') + 1))
+#: The constants.
+_CONSTANTS = frozenset({'T', 'F'})
+#: The binary operators.
+_BINARY = frozenset({'&', '|', '->'})
+# For Chapter 3:
+# _BINARY = frozenset({'&', '|',  '->', '+', '<->', '-&', '-|'})
+#: The number of operands of each constant and operator.
+_ARITY = {**dict.fromkeys(_CONSTANTS, 0), '~': 1, **dict.fromkeys(_BINARY, 2)}
 
-from logic_utils import frozen, memoized_parameterless_method
-
-@lru_cache(maxsize=100) # Cache the return value of is_variable
 def is_variable(string: str) -> bool:
     """Checks if the given string is an atomic proposition.
 
@@ -21,13 +33,14 @@ def is_variable(string: str) -> bool:
         string: string to check.
 
     Returns:
-        ``True`` if the given string is an atomic proposition, ``False``
-        otherwise.
+        ``True`` if the given string is an atomic proposition, i.e., a letter
+        between ``'p'`` and ``'z'`` optionally followed by ASCII digits,
+        ``False`` otherwise.
     """
-    return string[0] >= 'p' and string[0] <= 'z' and \
-        (len(string) == 1 or string[1:].isdigit())
+    suffix = string[1:]
+    return bool(string) and string[0] in _VAR_FIRST and \
+        (suffix == '' or (suffix.isascii() and suffix.isdigit()))
 
-@lru_cache(maxsize=100) # Cache the return value of is_constant
 def is_constant(string: str) -> bool:
     """Checks if the given string is a constant.
 
@@ -37,9 +50,8 @@ def is_constant(string: str) -> bool:
     Returns:
         ``True`` if the given string is a constant, ``False`` otherwise.
     """
-    return string == 'T' or string == 'F'
+    return string in _CONSTANTS
 
-@lru_cache(maxsize=100) # Cache the return value of is_unary
 def is_unary(string: str) -> bool:
     """Checks if the given string is a unary operator.
 
@@ -51,7 +63,6 @@ def is_unary(string: str) -> bool:
     """
     return string == '~'
 
-@lru_cache(maxsize=100) # Cache the return value of is_binary
 def is_binary(string: str) -> bool:
     """Checks if the given string is a binary operator.
 
@@ -61,25 +72,31 @@ def is_binary(string: str) -> bool:
     Returns:
         ``True`` if the given string is a binary operator, ``False`` otherwise.
     """
-    return string == '&' or string == '|' or string == '->'
-    # For Chapter 3:
-    # return string in {'&', '|',  '->', '+', '<->', '-&', '-|'}
+    return string in _BINARY
 
-@lru_cache(maxsize=100) # Cache the return value of split_str
-def split_str(string):
-    """
-    """
-    prefix, rest = (string[:2], string[2:]) if \
-        (string and string[0] == '-') else \
-        (string[:1], string[1:])
+#: A single token of a formula: an atomic proposition, a ``'-'`` together with
+#: the character after it (as in ``'->'``), or any other single character.
+#: Atomic propositions, the most common tokens, are tried first.
+_TOKEN_RE = re.compile(r'[p-z][0-9]*|-.?|.', re.DOTALL)
 
-    if prefix and is_variable(prefix):
-        ds = ''.join(takewhile(lambda d: d.isdigit(),
-                               rest))
-        m = len(ds)
-        prefix, rest = (prefix + rest[:m]), rest[m:]
+def _tokenize(string: str) -> List[str]:
+    """Splits the given string into tokens.
 
-    return prefix, rest
+    Parameters:
+        string: string to split.
+
+    Returns:
+        The tokens of the given string, in order. A variable name is taken as
+        a whole (e.g., ``'x12'`` and not just ``'x1'``), a ``'-'`` is taken
+        together with the character after it, and any other character is a
+        token by itself, so the tokens always concatenate back to the given
+        string. Tokens are interned, so that the roots of all parsed formulas
+        share one string per symbol.
+    """
+    return list(map(sys.intern, _TOKEN_RE.findall(string)))
+
+#: The live atomic formulas, by root, shared by all equal atomic formulas.
+_atom_cache: WeakValueDictionary[str, Formula] = WeakValueDictionary()
 
 @frozen
 class Formula:
@@ -97,6 +114,36 @@ class Formula:
     root: str
     first: Optional[Formula]
     second: Optional[Formula]
+    # The _variables, _operators and _polish slots hold the results of the
+    # corresponding methods once computed, or None. The _frozen slot is used by
+    # the frozen decorator, and the weak reference slot lets atomic formulas be
+    # held in _atom_cache.
+    __slots__ = ('root', 'first', 'second', '_repr', '_hash', '_variables',
+                 '_operators', '_polish', '_frozen', '__weakref__')
+
+    def __new__(cls, root: str, first: Optional[Formula] = None,
+                second: Optional[Formula] = None) -> Formula:
+        """Creates a `Formula` with the given root and root operands, reusing
+        the existing instance for an atomic formula that is still alive.
+
+        Parameters:
+            root: the root for the formula tree.
+            first: the first operand to the root, if the root is a unary or
+                binary operator.
+            second: the second operand to the root, if the root is a binary
+                operator.
+
+        Returns:
+            The live atomic formula with the given root if there are no
+            operands and there is one, or otherwise a new uninitialized formula.
+            The root is only classified by `__init__`, which also registers
+            new atomic formulas.
+        """
+        if first is None and second is None:
+            atom = _atom_cache.get(root)
+            if atom is not None:
+                return atom
+        return super().__new__(cls)
 
     def __init__(self, root: str, first: Optional[Formula] = None,
                  second: Optional[Formula] = None):
@@ -109,18 +156,36 @@ class Formula:
             second: the second operand to the root, if the root is a binary
                 operator.
         """
-        if is_variable(root) or is_constant(root):
+        arity = _ARITY.get(root)
+        if arity is None:
+            assert is_variable(root)
+            arity = 0
+        # The hash is computed once here from the operands' hashes, while the
+        # string representation of a compound formula is only built on demand.
+        # All fields are written with object.__setattr__, skipping the guard
+        # that the frozen decorator only needs for writes after construction.
+        object.__setattr__(self, 'first', first)
+        object.__setattr__(self, 'second', second)
+        if arity == 0:
             assert first is None and second is None
-            self.root = root
-        elif is_unary(root):
+            object.__setattr__(self, '_repr', root)
+            object.__setattr__(self, '_hash', hash(root))
+        elif arity == 1:
             assert first is not None and second is None
-            self.root, self.first = root, first
+            object.__setattr__(self, '_repr', None)
+            object.__setattr__(self, '_hash', hash((root, first._hash)))
         else:
-            assert is_binary(root)
             assert first is not None and second is not None
-            self.root, self.first, self.second = root, first, second
+            object.__setattr__(self, '_repr', None)
+            object.__setattr__(self, '_hash',
+                               hash((root, first._hash, second._hash)))
+        object.__setattr__(self, 'root', root)
+        object.__setattr__(self, '_variables', None)
+        object.__setattr__(self, '_operators', None)
+        object.__setattr__(self, '_polish', None)
+        if arity == 0:
+            _atom_cache[root] = self
 
-    @memoized_parameterless_method
     def __repr__(self) -> str:
         """Computes the string representation of the current formula.
 
@@ -128,13 +193,24 @@ class Formula:
             The standard string representation of the current formula.
         """
         # Task 1.1
-        if is_constant(self.root) or is_variable(self.root):
-            return self.root
-        elif is_unary(self.root):
-            return ''.join(map(str, [self.root, self.first]))
-        elif is_binary(self.root):
-            return ''.join(map(str, ['(', self.first, self.root,
-                                     self.second, ')']))
+        if self._repr is None:
+            parts = []
+            # Formulas still to be written out, or strings to write as is.
+            stack = [self]
+            while stack:
+                f = stack.pop()
+                if isinstance(f, str):
+                    parts.append(f)
+                elif f._repr is not None:
+                    parts.append(f._repr)
+                elif is_unary(f.root):
+                    parts.append(f.root)
+                    stack.append(f.first)
+                else:
+                    parts.append('(')
+                    stack.extend((')', f.second, f.root, f.first))
+            object.__setattr__(self, '_repr', ''.join(parts))
+        return self._repr
 
     def __eq__(self, other: object) -> bool:
         """Compares the current formula with the given one.
@@ -146,7 +222,21 @@ class Formula:
             ``True`` if the given object is a `Formula` object that equals the
             current formula, ``False`` otherwise.
         """
-        return isinstance(other, Formula) and str(self) == str(other)
+        if not isinstance(other, Formula):
+            return False
+        stack = [(self, other)]
+        while stack:
+            f, g = stack.pop()
+            if f is g:
+                continue
+            if f._hash != g._hash or f.root != g.root:
+                return False
+            arity = _ARITY.get(f.root, 0)
+            if arity == 2:
+                stack.append((f.second, g.second))
+            if arity >= 1:
+                stack.append((f.first, g.first))
+        return True
 
     def __ne__(self, other: object) -> bool:
         """Compares the current formula with the given one.
@@ -161,9 +251,37 @@ class Formula:
         return not self == other
 
     def __hash__(self) -> int:
-        return hash(str(self))
+        return self._hash
+
+    def __reduce__(self) -> Tuple[type, Tuple[str, Optional[Formula],
+                                              Optional[Formula]]]:
+        """Describes how to reconstruct the current formula when unpickled.
+
+        Returns:
+            The `Formula` class and the arguments to construct the current
+            formula with.
+        """
+        return Formula, (self.root, self.first, self.second)
+
+    def __copy__(self) -> Formula:
+        """Copies the current formula.
+
+        Returns:
+            The current formula itself, as it is immutable.
+        """
+        return self
+
+    def __deepcopy__(self, memo: Mapping[int, Any]) -> Formula:
+        """Copies the current formula, including its operands.
+
+        Parameters:
+            memo: objects already copied, by id.
+
+        Returns:
+            The current formula itself, as it is immutable.
+        """
+        return self
 
-    @memoized_parameterless_method
     def variables(self) -> Set[str]:
         """Finds all atomic propositions (variables) in the current formula.
 
@@ -171,21 +289,21 @@ class Formula:
             A set of all atomic propositions used in the current formula.
         """
         # Task 1.2
-        def vars_with_acc(f: Formula, acc: Set[str]) -> Set[str]:
-            if is_constant(f.root):
-                return acc
-            elif is_variable(f.root):
-                acc.add(f.root)
-                return acc
-            elif is_unary(f.root):
-                return vars_with_acc(f.first, acc)
-            else:
-                bcc = vars_with_acc(f.first, acc)
-                return vars_with_acc(f.second, bcc)
+        if self._variables is None:
+            variables = set()
+            stack = [self]
+            while stack:
+                f = stack.pop()
+                if f.root in _BINARY:
+                    stack.append(f.second)
+                    stack.append(f.first)
+                elif is_unary(f.root):
+                    stack.append(f.first)
+                elif f.root not in _CONSTANTS:
+                    variables.add(f.root)
+            object.__setattr__(self, '_variables', frozenset(variables))
+        return set(self._variables)
 
-        return vars_with_acc(self, set())
-
-    @memoized_parameterless_method
     def operators(self) -> Set[str]:
         """Finds all operators in the current formula.
 
@@ -194,21 +312,22 @@ class Formula:
             current formula.
         """
         # Task 1.3
-        def operators_with_acc(f: Formula, acc: Set[str]) -> Set[str]:
-            if is_variable(f.root):
-                return acc
-            elif is_constant(f.root):
-                acc.add(f.root)
-                return acc
-            elif is_unary(f.root):
-                acc.add(f.root)
-                return operators_with_acc(f.first, acc)
-            else:
-                acc.add(f.root)
-                bcc = operators_with_acc(f.first, acc)
-                return operators_with_acc(f.second, bcc)
-
-        return operators_with_acc(self, set())
+        if self._operators is None:
+            operators = set()
+            stack = [self]
+            while stack:
+                f = stack.pop()
+                if f.root in _BINARY:
+                    operators.add(f.root)
+                    stack.append(f.second)
+                    stack.append(f.first)
+                elif is_unary(f.root):
+                    operators.add(f.root)
+                    stack.append(f.first)
+                elif f.root in _CONSTANTS:
+                    operators.add(f.root)
+            object.__setattr__(self, '_operators', frozenset(operators))
+        return set(self._operators)
 
     @staticmethod
     def _parse_prefix(string: str) -> Tuple[Optional[Formula], str]:
@@ -228,38 +347,55 @@ class Formula:
             is a string with some human-readable content.
         """
         # Task 1.4
-        prefix, rest = split_str(string)
-        if prefix and (is_constant(prefix) or is_variable(prefix)):
-            return Formula(prefix), rest
-
-        elif is_unary(prefix):
-            ff, rr = Formula._parse_prefix(rest)
-            if ff is None:
-                return ff, rr
+        # Operators still waiting for operands, innermost last: a unary
+        # operator as [operator], and an opening parenthesis as
+        # ['(', first operand, binary operator], where the last two are None
+        # until the first operand has been parsed.
+        pending = []
+        # The empty token marks the end of the input, and is rejected wherever
+        # it is read.
+        tokens = _tokenize(string) + ['']
+        pos = 0
+        while True:
+            prefix = tokens[pos]
+            pos += 1
+            if prefix and (is_constant(prefix) or is_variable(prefix)):
+                formula = Formula(prefix)
+            elif is_unary(prefix):
+                pending.append([prefix])
+                continue
+            elif prefix == '(':
+                pending.append([prefix, None, None])
+                continue
             else:
-                return Formula(prefix, ff), rr
-
-        elif prefix == '(':
-            ff, rr = Formula._parse_prefix(rest)
-            if ff is None:
-                return ff, rr
-
-            bop, rem = split_str(rr)
-            if not is_binary(bop):
-                return (None, 'Unexpected symbol {} in {}'.
-                        format(bop, rem))
-
-            ss, tt = Formula._parse_prefix(rem)
-            if ss is None:
-                return ss, tt
-
-            if not tt.startswith(')'):
-                return None, 'Unexpected symbol {} in {}'.format(tt[:1], tt)
-
-            return Formula(bop, ff, ss), tt[1:]
-
-        else:
-            return None, "Unexpected input {}".format(string)
+                return (None, "Unexpected input {}".
+                        format(''.join(tokens[pos - 1:])))
+
+            # Fold the completed formula into the pending operators until one
+            # of them still needs another operand.
+            while pending:
+                top = pending[-1]
+                if is_unary(top[0]):
+                    pending.pop()
+                    formula = Formula(top[0], formula)
+                elif top[1] is None:
+                    bop = tokens[pos]
+                    pos += 1
+                    if not is_binary(bop):
+                        return (None, 'Unexpected symbol {} in {}'.
+                                format(bop, ''.join(tokens[pos:])))
+                    top[1], top[2] = formula, bop
+                    break
+                else:
+                    if tokens[pos] != ')':
+                        rest = ''.join(tokens[pos:])
+                        return (None, 'Unexpected symbol {} in {}'.
+                                format(rest[:1], rest))
+                    pending.pop()
+                    formula = Formula(top[2], top[1], formula)
+                    pos += 1
+            else:
+                return formula, ''.join(tokens[pos:])
 
     @staticmethod
     def is_formula(string: str) -> bool:
@@ -273,8 +409,7 @@ class Formula:
             representation of a formula, ``False`` otherwise.
         """
         # Task 1.5
-        f, r = Formula._parse_prefix(string)
-        return ((f is not None) and (r == ''))
+        return Formula._parse_cached(string) is not None
 
     @staticmethod
     def parse(string: str) -> Formula:
@@ -286,9 +421,27 @@ class Formula:
         Returns:
             A formula whose standard string representation is the given string.
         """
-        assert Formula.is_formula(string)
+        formula = Formula._parse_cached(string)
+        assert formula is not None
         # Task 1.6
-        return Formula._parse_prefix(string)[0]
+        return formula
+
+    @staticmethod
+    @lru_cache(maxsize=4096) # Cache the formulas parsed from recent strings
+    def _parse_cached(string: str) -> Optional[Formula]:
+        """Parses the given string into a formula, if it is a valid
+        representation of one.
+
+        Parameters:
+            string: string to parse.
+
+        Returns:
+            A formula whose standard string representation is the given string,
+            or ``None`` if the given string is not a valid standard string
+            representation of a formula.
+        """
+        f, r = Formula._parse_prefix(string)
+        return f if f is not None and r == '' else None
 
 # Optional tasks for Chapter 1
 
@@ -299,39 +452,60 @@ class Formula:
             The polish notation representation of the current formula.
         """
         # Optional Task 1.7
-        if is_constant(self.root) or is_variable(self.root):
-            return self.root
-        elif is_unary(self.root):
-            return ''.join([self.root, self.first.polish()])
-        else:
-            return ''.join([self.root, self.first.polish(),
-                            self.second.polish()])
+        if self._polish is None:
+            parts = []
+            stack = [self]
+            while stack:
+                f = stack.pop()
+                parts.append(f.root)
+                if f.root in _BINARY:
+                    stack.append(f.second)
+                    stack.append(f.first)
+                elif is_unary(f.root):
+                    stack.append(f.first)
+            object.__setattr__(self, '_polish', ''.join(parts))
+        return self._polish
 
+    @staticmethod
     def _parse_prefix_polish(string: str) -> Tuple[Optional[Formula], str]:
-        """
-        """
-        prefix, rest = split_str(string)
-        if prefix and (is_constant(prefix) or is_variable(prefix)):
-            return Formula(prefix), rest
-
-        elif is_unary(prefix):
-            ff, rr = Formula._parse_prefix_polish(rest)
-            if ff is None:
-                return ff, rr
-            else:
-                return Formula(prefix, ff), rr
+        """Parses a prefix of the given string into a formula.
 
-        elif is_binary(prefix):
-            ff, rr = Formula._parse_prefix_polish(rest)
-            if ff is None:
-                return ff, rr
-            ss, tt = Formula._parse_prefix_polish(rr)
-            if ss is None:
-                return ss, tt
-            return Formula(prefix, ff, ss), tt
+        Parameters:
+            string: string to parse in polish notation.
 
-        else:
-            return None, "Unexpected input {}".format(string)
+        Returns:
+            A pair of the parsed formula and the unparsed suffix of the string,
+            or of ``None`` and an error message if no prefix of the given string
+            is a valid polish notation representation of a formula.
+        """
+        # Operators still waiting for operands, innermost last, each with the
+        # operands parsed for it so far.
+        pending = []
+        # The empty token marks the end of the input, and is rejected wherever
+        # it is read.
+        tokens = _tokenize(string) + ['']
+        pos = 0
+        while True:
+            prefix = tokens[pos]
+            pos += 1
+            if prefix and (is_constant(prefix) or is_variable(prefix)):
+                formula = Formula(prefix)
+            elif is_unary(prefix) or is_binary(prefix):
+                pending.append((prefix, []))
+                continue
+            else:
+                return (None, "Unexpected input {}".
+                        format(''.join(tokens[pos - 1:])))
+
+            while pending:
+                operator, operands = pending[-1]
+                operands.append(formula)
+                if len(operands) < (1 if is_unary(operator) else 2):
+                    break
+                pending.pop()
+                formula = Formula(operator, *operands)
+            else:
+                return formula, ''.join(tokens[pos:])
 
     @staticmethod
     def parse_polish(string: str) -> Formula:
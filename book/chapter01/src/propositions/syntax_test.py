@@ -6,9 +6,14 @@
 
 """Tests for the propositions.syntax module."""
 
+import copy
+import gc
+import pickle
+
 from logic_utils import frozendict
 
 from propositions.syntax import *
+from propositions.syntax import _atom_cache
 
 # Testing for Chapter 1
 
@@ -74,6 +79,8 @@ parsing_tests = [('', None, ''),
                  ('~x', '~x', ''),
                  ('~', None, ''),
                  ('x2', 'x2', ''),
+                 ('x\u0661', 'x', '\u0661'),
+                 ('x\u00b2', 'x', '\u00b2'),
                  ('x|y', 'x', '|y'),
                  ('(p|x13)', '(p|x13)', ''),
                  ('((p|x13))', None, ''),
@@ -135,6 +142,24 @@ def test_parse(debug=False):
         assert type(ff) is Formula
         assert str(ff) == f
 
+def test_parse_cached(debug=False):
+    if(debug):
+        print()
+    for s, f, r in parsing_tests:
+        if debug:
+            print("Testing that is_formula and parse agree on", s)
+        if Formula.is_formula(s):
+            ff = Formula.parse(s)
+            assert Formula.parse(s) is ff
+            assert str(ff) == s
+        else:
+            try:
+                Formula.parse(s)
+                accepted = True
+            except AssertionError:
+                accepted = False
+            assert not accepted, "parse accepted invalid input " + s
+
 # Tests for optional tasks in Chapter 1
 
 def test_polish(debug=False):
@@ -154,6 +179,86 @@ def test_parse_polish(debug=False):
             print("Testing polish parsing of formula", polish)
         assert Formula.parse_polish(polish).polish() == polish
 
+# Tests for shared and copied formulas
+
+def test_atoms_shared(debug=False):
+    if debug:
+        print("Testing that equal atomic formulas are shared")
+    f = Formula.parse('(x77&~(x77|T))')
+    assert f.first is f.second.first.first is Formula('x77')
+    assert f.second.first.second is Formula('T')
+    assert Formula('x77').first is None and Formula('x77').second is None
+    if debug:
+        print("Testing that shared atomic formulas are not reinitialized")
+    assert f.first.variables() == {'x77'}
+    assert Formula('x77')._variables == {'x77'}
+    try:
+        Formula('x77').root = 'x78'
+        assigned = True
+    except Exception:
+        assigned = False
+    assert not assigned, "Assigned to the root of a shared atomic formula"
+    assert Formula('x77').root == 'x77'
+    if debug:
+        print("Testing that unreferenced atomic formulas are freed")
+    # Formula.parse also keeps recently parsed formulas alive.
+    Formula._parse_cached.cache_clear()
+    del f
+    gc.collect()
+    assert 'x77' not in _atom_cache
+
+def test_copy(debug=False):
+    for s in ['p', '~F', '(p&~q)', '((x1->T)|~(y&x1))']:
+        if debug:
+            print("Testing copying and pickling of", s)
+        f = Formula.parse(s)
+        assert copy.copy(f) is f
+        assert copy.deepcopy(f) is f
+        g = pickle.loads(pickle.dumps(f))
+        assert type(g) is Formula and g == f and str(g) == s
+        try:
+            g.root = 'r'
+            assigned = True
+        except Exception:
+            assigned = False
+        assert not assigned, "Assigned to the root of an unpickled formula"
+        assert str(g) == s
+
+# Tests for deeply nested formulas
+
+def test_repr_deep(debug=False):
+    depth = 40000
+    if debug:
+        print("Testing representation of a formula with", depth,
+              "nested negations")
+    s = '~' * depth + '(p&q)'
+    f = Formula.parse(s)
+    g = Formula._parse_prefix(s)[0]
+    assert f is not g
+    assert f == g and hash(f) == hash(g)
+    assert f != Formula.parse('~' * depth + '(p|q)')
+    assert str(f) == s
+
+def test_parse_deep(debug=False):
+    depth = 5000
+    if debug:
+        print("Testing parsing of a formula with", depth,
+              "nested binary operators")
+    s = '(' * depth + 'p' + '&~q)' * depth
+    assert Formula.is_formula(s)
+    f, r = Formula._parse_prefix(s + '|')
+    assert r == '|'
+    assert str(f) == s
+    assert not Formula.is_formula(s[:-1])
+
+def test_parse_polish_deep(debug=False):
+    depth = 5000
+    if debug:
+        print("Testing polish parsing of a formula with", depth,
+              "nested binary operators")
+    polish = '&~' * depth + 'p' + 'q' * depth
+    assert Formula.parse_polish(polish).polish() == polish
+
 # Tests for Chapter 3
 
 def test_repr_all_operators(debug=False):
@@ -325,10 +430,16 @@ def test_ex1(debug=False):
     test_parse_prefix(debug)
     test_is_formula(debug)
     test_parse(debug)
+    test_parse_cached(debug)
+    test_atoms_shared(debug)
+    test_copy(debug)
+    test_repr_deep(debug)
+    test_parse_deep(debug)
     
 def test_ex1_opt(debug=False):
     test_polish(debug)
     test_parse_polish(debug)
+    test_parse_polish_deep(debug)
 
 def test_ex3(debug=False):
     assert is_binary('+'), "Change is_binary() before testing Chapter 3 tasks."